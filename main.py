@@ -1,81 +1,219 @@
 import typer
 import boto3
 from datetime import datetime, timedelta, timezone
-from tabulate import tabulate
+import botocore.config
 import botocore.exceptions
 import json
-import matplotlib.pyplot as plt
+import functools
+from array import array
+import threading
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 app = typer.Typer(help="AWS CloudWatch Logs Cost Monitor")
 
+INGESTION_PRICE_PER_GB = 0.50  # $0.50/GB
+STORAGE_PRICE_PER_GB_MONTH = 0.03  # $0.03/GB-month
+
+# Adaptive retries back off on throttling when many profiles are analyzed in parallel
+BOTO_CONFIG = botocore.config.Config(
+    max_pool_connections=50,
+    retries={"max_attempts": 10, "mode": "adaptive"},
+    tcp_keepalive=True
+)
+
+# Sessions aren't thread-safe, so client creation is serialized per profile
+_session_locks = {}
+
+@functools.lru_cache(maxsize=None)
+def _get_session(profile_name):
+    return boto3.Session(profile_name=profile_name)
+
+@functools.lru_cache(maxsize=None)
+def _build_client(profile_name, service):
+    return _get_session(profile_name).client(service, config=BOTO_CONFIG)
+
+def get_client(profile_name, service):
+    """Return a shared client for a profile and service; clients are thread-safe once built, sessions are not."""
+    with _session_locks.setdefault(profile_name, threading.Lock()):
+        return _build_client(profile_name, service)
+
+LOG_GROUP_CACHE_DIR = Path.home() / ".aws_cost_monitor" / "loggroups"
+LOG_GROUP_CACHE_TTL = timedelta(hours=1)
+
+# describe_log_groups returns at most 50 groups per page
+LOG_GROUP_PAGE_SIZE = 50
+
 def get_log_groups(client):
-    log_groups = []
-    paginator = client.get_paginator("describe_log_groups")
-    for page in paginator.paginate():
-        log_groups.extend(page["logGroups"])
-    return log_groups
-
-def get_metric_data(client, metric_name, log_group_name, start_time, end_time):
-    response = client.get_metric_data(
-        MetricDataQueries=[{
-            "Id": "m1",
-            "MetricStat": {
-                "Metric": {
-                    "Namespace": "AWS/Logs",
-                    "MetricName": metric_name,
-                    "Dimensions": [{"Name": "LogGroupName", "Value": log_group_name}]
-                },
-                "Period": 86400,
-                "Stat": "Sum" if metric_name == "IncomingBytes" else "Average"
-            },
+    """Yield (logGroupName, storedBytes) pairs one page at a time."""
+    kwargs = {"limit": LOG_GROUP_PAGE_SIZE}
+    while True:
+        page = client.describe_log_groups(**kwargs)
+        yield from ((group["logGroupName"], group.get("storedBytes", 0) or 0) for group in page["logGroups"])
+        if "nextToken" not in page:
+            break
+        kwargs["nextToken"] = page["nextToken"]
+
+MAX_METRIC_DATA_QUERIES = 500
+# GetMetricData returns at most 100,800 datapoints per call
+MAX_DATAPOINTS = 100800
+# A single SEARCH expression returns at most 500 time series, and only finds
+# metrics that received data in the last two weeks
+MAX_SEARCH_RESULTS = 500
+SEARCH_LOOKBACK = timedelta(days=14)
+INCOMING_BYTES_SEARCH = "SEARCH('{AWS/Logs,LogGroupName} MetricName=\"IncomingBytes\"', 'Sum', 86400)"
+
+def max_datapoints(start_time, end_time, series):
+    """Upper bound on daily datapoints for a request, capped at the API limit."""
+    return min(max((end_time - start_time).days, 1) * series, MAX_DATAPOINTS)
+
+def get_metric_data_search(client, start_time, end_time):
+    """Fetch daily IncomingBytes for every log group with a single SEARCH expression, keyed by LogGroupName.
+
+    Returns None when the result reaches the series cap, since groups may have been dropped.
+    """
+    incoming = {}
+    kwargs = {
+        "MetricDataQueries": [{
+            "Id": "q1",
+            "Expression": INCOMING_BYTES_SEARCH,
+            "Label": "${PROP('Dim.LogGroupName')}",
             "ReturnData": True
         }],
-        StartTime=start_time,
-        EndTime=end_time
-    )
-    return response["MetricDataResults"][0]["Values"]
+        "StartTime": start_time,
+        "EndTime": end_time,
+        "ScanBy": "TimestampAscending",
+        "MaxDatapoints": max_datapoints(start_time, end_time, MAX_SEARCH_RESULTS)
+    }
+    while True:
+        response = client.get_metric_data(**kwargs)
+        for result in response["MetricDataResults"]:
+            incoming.setdefault(result["Label"], []).extend(result["Values"])
+        if "NextToken" not in response:
+            break
+        kwargs["NextToken"] = response["NextToken"]
+    if len(incoming) >= MAX_SEARCH_RESULTS:
+        return None
+    return incoming
 
-def calculate_costs(profile_name: str, days: int = 30):
+def log_group_cache_file(profile_name, region):
+    return LOG_GROUP_CACHE_DIR / f"{profile_name}.{region}.json"
+
+def load_cached_log_groups(profile_name, region):
+    """Return cached {logGroupName: storedBytes} for a profile and region, or None if missing or older than the TTL."""
+    try:
+        cached = json.loads(log_group_cache_file(profile_name, region).read_text())
+        groups = cached["groups"]
+        cached_region = cached["region"]
+        fetched_at = datetime.fromisoformat(cached["fetched_at"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if not isinstance(groups, dict) or cached_region != region or fetched_at.tzinfo is None:
+        return None
+    if datetime.now(timezone.utc) - fetched_at > LOG_GROUP_CACHE_TTL:
+        return None
+    return groups
+
+def save_cached_log_groups(profile_name, region, stored_by_group):
     try:
-        # Create session with specific profile
-        session = boto3.Session(profile_name=profile_name)
-        logs_client = session.client("logs")
-        cw_client = session.client("cloudwatch")
+        LOG_GROUP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        log_group_cache_file(profile_name, region).write_text(json.dumps({
+            "region": region,
+            "groups": stored_by_group,
+            "fetched_at": datetime.now(timezone.utc).isoformat()
+        }))
+    except OSError as e:
+        typer.echo(f"Could not write log group cache for profile {profile_name}: {str(e)}")
+
+def get_metric_data_batch(client, log_group_names, start_time, end_time):
+    """Fetch daily IncomingBytes for many log groups, up to 500 queries per GetMetricData call."""
+    queries = [{
+        "Id": f"m{i}_in",
+        "MetricStat": {
+            "Metric": {
+                "Namespace": "AWS/Logs",
+                "MetricName": "IncomingBytes",
+                "Dimensions": [{"Name": "LogGroupName", "Value": name}]
+            },
+            "Period": 86400,
+            "Stat": "Sum"
+        },
+        "ReturnData": True
+    } for i, name in enumerate(log_group_names)]
+
+    incoming = {name: [] for name in log_group_names}
+    for offset in range(0, len(queries), MAX_METRIC_DATA_QUERIES):
+        chunk = queries[offset:offset + MAX_METRIC_DATA_QUERIES]
+        kwargs = {
+            "MetricDataQueries": chunk,
+            "StartTime": start_time,
+            "EndTime": end_time,
+            "ScanBy": "TimestampAscending",
+            "MaxDatapoints": max_datapoints(start_time, end_time, len(chunk))
+        }
+        while True:
+            response = client.get_metric_data(**kwargs)
+            for result in response["MetricDataResults"]:
+                index = int(result["Id"][1:].split("_", 1)[0])
+                incoming[log_group_names[index]].extend(result["Values"])
+            if "NextToken" not in response:
+                break
+            kwargs["NextToken"] = response["NextToken"]
+    return incoming
+
+def get_incoming_bytes(client, log_group_names, start_time, end_time):
+    """Fetch daily IncomingBytes per log group."""
+    # One SEARCH query covers every group, but only within its lookback and series cap
+    incoming = None
+    # The lookback runs back from now, not from the midnight-aligned end_time
+    if datetime.now(timezone.utc) - start_time <= SEARCH_LOOKBACK and len(log_group_names) < MAX_SEARCH_RESULTS:
+        incoming = get_metric_data_search(client, start_time, end_time)
+    if incoming is None:
+        incoming = get_metric_data_batch(client, log_group_names, start_time, end_time)
+    return incoming
 
-        log_groups = get_log_groups(logs_client)
-        end_time = datetime.now(timezone.utc)
+def calculate_costs(profile_name: str, days: int = 30, use_cache: bool = True):
+    try:
+        logs_client = get_client(profile_name, "logs")
+        cw_client = get_client(profile_name, "cloudwatch")
+
+        # Log groups are regional, so the cache is keyed by the region the clients resolved to
+        region = logs_client.meta.region_name
+        stored_by_group = load_cached_log_groups(profile_name, region) if use_cache else None
+        if stored_by_group is None:
+            stored_by_group = dict(get_log_groups(logs_client))
+            save_cached_log_groups(profile_name, region, stored_by_group)
+        group_names = list(stored_by_group)
+
+        # Align to midnight UTC so repeated runs issue identical daily queries
+        end_time = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
         start_time = end_time - timedelta(days=days)
 
-        costs = []
-        for group in log_groups:
-            group_name = group["logGroupName"]
-            
-            incoming_bytes = get_metric_data(cw_client, "IncomingBytes", group_name, start_time, end_time)
-            ingestion_gb = sum(incoming_bytes) / 1e9 if incoming_bytes else 0
-            
-            # CloudWatch Logs doesn't have StoredBytes metric, so we'll estimate storage from log group info
-            # Get log group details to estimate storage
-            try:
-                log_group_info = logs_client.describe_log_groups(logGroupNamePrefix=group_name, limit=1)
-                if log_group_info['logGroups']:
-                    stored_bytes = log_group_info['logGroups'][0].get('storedBytes', 0)
-                    current_storage_gb = stored_bytes / 1e9 if stored_bytes else 0
-                else:
-                    current_storage_gb = 0
-            except Exception:
-                current_storage_gb = 0
-
-            storage_gb_month = current_storage_gb * (days / 30)
-
-            ingestion_cost = ingestion_gb * 0.50  # $0.50/GB
-            storage_cost = storage_gb_month * 0.03  # $0.03/GB-month
-
-            costs.append({
-                "LogGroup": group_name,
-                "IngestionCost": ingestion_cost,
-                "StorageCost": storage_cost,
-                "TotalCost": ingestion_cost + storage_cost
-            })
+        incoming_by_group = get_incoming_bytes(cw_client, group_names, start_time, end_time)
+
+        # Daily datapoints as a (groups, days) matrix, zero-padded for groups with partial history
+        max_points = max((len(values) for values in incoming_by_group.values()), default=0)
+        incoming = np.zeros((len(group_names), max_points), dtype=np.float64)
+        for row, group_name in enumerate(group_names):
+            values = incoming_by_group.get(group_name, [])
+            incoming[row, :len(values)] = values
+        # storedBytes is a snapshot at listing time, the same figure the console shows
+        stored = np.array([stored_by_group[name] for name in group_names], dtype=np.float64)
+
+        ingestion_gb = incoming.sum(axis=1) / 1e9
+        storage_gb_month = stored / 1e9 * (days / 30)
+
+        ingestion_cost = ingestion_gb * INGESTION_PRICE_PER_GB
+        storage_cost = storage_gb_month * STORAGE_PRICE_PER_GB_MONTH
+        total_cost = ingestion_cost + storage_cost
+
+        costs = [{
+            "LogGroup": group_name,
+            "IngestionCost": float(ingestion_cost[i]),
+            "StorageCost": float(storage_cost[i]),
+            "TotalCost": float(total_cost[i])
+        } for i, group_name in enumerate(group_names)]
 
         return costs
     except botocore.exceptions.ClientError as e:
@@ -85,39 +223,151 @@ def calculate_costs(profile_name: str, days: int = 30):
         typer.echo(f"Error in profile {profile_name}: {str(e)}")
         return []
 
+def collect_costs(profile_list, days: int, workers: int, use_cache: bool = True):
+    """Run calculate_costs for each profile in parallel, yielding (profile, costs) as they finish."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(calculate_costs, profile, days, use_cache): profile for profile in profile_list}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+CHART_SIZE = (1200, 800)
+CHART_MARGINS = {"left": 90, "right": 30, "top": 60, "bottom": 260}
+CHART_Y_TICKS = 5
+CHART_LABEL_LENGTH = 40
+BAR_COLOR = (31, 119, 180)
+
+def shorten_chart_label(label):
+    """Shorten a profile:log-group label by eliding the middle of the group name, keeping the profile."""
+    if len(label) <= CHART_LABEL_LENGTH:
+        return label
+    profile, _, group = label.partition(":")
+    keep = CHART_LABEL_LENGTH - len(profile) - len(":...")
+    if keep <= 0:
+        return label
+    return f"{profile}:...{group[-keep:]}"
+
+def render_charts_pillow(labels, charts):
+    """Draw one bar chart per (title, filename, values) in charts directly with Pillow."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.load_default()
+    width, height = CHART_SIZE
+    left, right, top, bottom = (CHART_MARGINS[k] for k in ("left", "right", "top", "bottom"))
+
+    def text_image(text, angle):
+        x0, y0, x1, y1 = font.getbbox(text)
+        image = Image.new("RGBA", (x1 + 2, y1 + 2), (255, 255, 255, 0))
+        ImageDraw.Draw(image).text((0, 0), text, fill="black", font=font)
+        return image.rotate(angle, expand=True)
+
+    # Tick labels are identical across charts, so render them once; any that
+    # collide once shortened are drawn in full so every bar stays identifiable
+    short_labels = [shorten_chart_label(label) for label in labels]
+    short_labels = [short if short_labels.count(short) == 1 else label for short, label in zip(short_labels, labels)]
+    tick_labels = [text_image(label, 45) for label in short_labels]
+    y_label = text_image("Cost ($)", 90)
+    x_label = text_image("Log Group (Profile:Group)", 0)
+
+    # Widen the left margin so the first rotated label stays on the canvas
+    left = max(left, tick_labels[0].width)
+    plot_width = width - left - right
+    plot_height = height - top - bottom
+    baseline = top + plot_height
+    slot = plot_width / len(labels)
+
+    for title, filename, column_values in charts:
+        y_max = float(column_values.max()) or 1.0
+
+        image = Image.new("RGB", CHART_SIZE, "white")
+        draw = ImageDraw.Draw(image)
+        title_width = draw.textbbox((0, 0), title, font=font)[2]
+        draw.text(((width - title_width) / 2, top / 2), title, fill="black", font=font)
+
+        for tick in range(CHART_Y_TICKS + 1):
+            y = baseline - plot_height * tick / CHART_Y_TICKS
+            tick_text = f"${y_max * tick / CHART_Y_TICKS:.2f}"
+            tick_width, tick_height = draw.textbbox((0, 0), tick_text, font=font)[2:]
+            draw.line([(left, y), (width - right, y)], fill=(220, 220, 220))
+            draw.text((left - tick_width - 6, y - tick_height / 2), tick_text, fill="black", font=font)
+
+        for i, value in enumerate(column_values):
+            x0 = left + slot * (i + 0.1)
+            x1 = left + slot * (i + 0.9)
+            draw.rectangle([x0, baseline - plot_height * value / y_max, x1, baseline], fill=BAR_COLOR)
+            # Right-align the rotated label under the bar centre, as matplotlib's ha='right' does
+            tick_label = tick_labels[i]
+            image.paste(tick_label, (int(left + slot * (i + 0.5)) - tick_label.width, baseline + 4), tick_label)
+
+        draw.line([(left, top), (left, baseline), (width - right, baseline)], fill="black")
+        image.paste(y_label, (8, top + (plot_height - y_label.height) // 2), y_label)
+        image.paste(x_label, ((width - x_label.width) // 2, height - x_label.height - 10), x_label)
+        image.save(filename)
+
+def render_charts_matplotlib(labels, charts):
+    """Draw one bar chart per (title, filename, values) in charts with matplotlib, reusing one figure."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+    for title, filename, column_values in charts:
+        ax.clear()
+        ax.bar(labels, column_values)
+        ax.set_title(title)
+        ax.set_xlabel("Log Group (Profile:Group)")
+        ax.set_ylabel("Cost ($)")
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+        fig.savefig(filename, dpi=100, bbox_inches='tight')
+    plt.close(fig)
+
+SUMMARY_ROW_FORMAT = "{:<30} {:<60} {:>14} {:>12} {:>12}"
+
 @app.command()
-def summarize(profiles: str = typer.Option(..., help="Comma-separated list of AWS profiles to analyze"), days: int = typer.Option(30, help="Number of days to summarize costs for")):
+def summarize(profiles: str = typer.Option(..., help="Comma-separated list of AWS profiles to analyze"), days: int = typer.Option(30, help="Number of days to summarize costs for"), workers: int = typer.Option(10, min=1, help="Number of profiles to analyze in parallel"), no_cache: bool = typer.Option(False, "--no-cache", help="Ignore cached log group lists and fetch them again"), table: bool = typer.Option(False, "--table", help="Buffer all rows and print them as one grid table")):
     """Summarize CloudWatch Logs costs by profile and log group."""
-    profile_list = [p.strip() for p in profiles.split(",")]
-    summary = []
+    profile_list = list(dict.fromkeys(p.strip() for p in profiles.split(",")))
+    summary = {}
     profile_totals = {}
+    found_costs = False
     
-    for profile in profile_list:
-        typer.echo(f"Analyzing profile: {profile}")
-        costs = calculate_costs(profile, days)
+    typer.echo(f"Analyzing profiles: {', '.join(profile_list)}")
+    if not table:
+        # Rows are printed as each profile finishes, so fix the column widths up front
+        typer.echo(SUMMARY_ROW_FORMAT.format("Profile", "LogGroup", "IngestionCost", "StorageCost", "TotalCost"))
+    for profile, costs in collect_costs(profile_list, days, workers, not no_cache):
         profile_total = 0
         
         for cost in costs:
+            found_costs = True
             profile_total += cost['TotalCost']
-            summary.append({
+            row = {
                 "Profile": profile,
                 "LogGroup": cost["LogGroup"],
                 "IngestionCost": f"${cost['IngestionCost']:.2f}",
                 "StorageCost": f"${cost['StorageCost']:.2f}",
                 "TotalCost": f"${cost['TotalCost']:.2f}"
-            })
+            }
+            if table:
+                summary.setdefault(profile, []).append(row)
+            else:
+                typer.echo(SUMMARY_ROW_FORMAT.format(*row.values()))
         
         profile_totals[profile] = profile_total
 
-    if summary:
-        typer.echo(tabulate(summary, headers="keys", tablefmt="grid"))
+    if found_costs:
+        if table:
+            from tabulate import tabulate
+            # Buffered rows are grouped in the order profiles were given, not completion order
+            rows = [row for profile in profile_list for row in summary.get(profile, [])]
+            typer.echo(tabulate(rows, headers="keys", tablefmt="grid"))
         
         # Display totals per profile
         typer.echo("\n" + "="*60)
         typer.echo("TOTALS PER PROFILE")
         typer.echo("="*60)
-        for profile, total in profile_totals.items():
-            typer.echo(f"{profile}: ${total:.2f}")
+        # Futures finish in any order, so report totals in the order profiles were given
+        for profile in profile_list:
+            typer.echo(f"{profile}: ${profile_totals[profile]:.2f}")
         
         # Display grand total
         grand_total = sum(profile_totals.values())
@@ -127,48 +377,41 @@ def summarize(profiles: str = typer.Option(..., help="Comma-separated list of AW
         typer.echo("No costs found or access issues.")
 
 @app.command()
-def graph(profiles: str = typer.Option(..., help="Comma-separated list of AWS profiles to analyze"), days: int = typer.Option(30, help="Number of days to graph costs for")):
-    """Graph CloudWatch Logs costs by profile and log group using matplotlib (saves to PNG files)."""
-    profile_list = [p.strip() for p in profiles.split(",")]
-    all_costs = {}
+def graph(profiles: str = typer.Option(..., help="Comma-separated list of AWS profiles to analyze"), days: int = typer.Option(30, help="Number of days to graph costs for"), workers: int = typer.Option(10, min=1, help="Number of profiles to analyze in parallel"), no_cache: bool = typer.Option(False, "--no-cache", help="Ignore cached log group lists and fetch them again"), renderer: str = typer.Option("pillow", help="Chart renderer: pillow or matplotlib")):
+    """Graph CloudWatch Logs costs by profile and log group (saves to PNG files)."""
+    if renderer not in ("pillow", "matplotlib"):
+        raise typer.BadParameter("must be 'pillow' or 'matplotlib'", param_hint="--renderer")
+    profile_list = list(dict.fromkeys(p.strip() for p in profiles.split(",")))
+    # Parallel float32 columns, one entry per log group in arrival order
+    labels = []
+    ingestion, storage, total = array("f"), array("f"), array("f")
     
-    for profile in profile_list:
-        typer.echo(f"Analyzing profile: {profile}")
-        costs = calculate_costs(profile, days)
+    typer.echo(f"Analyzing profiles: {', '.join(profile_list)}")
+    for profile, costs in collect_costs(profile_list, days, workers, not no_cache):
+        typer.echo(f"Finished profile: {profile}")
         for cost in costs:
-            key = f"{profile}:{cost['LogGroup']}"
-            all_costs[key] = {
-                "Ingestion": cost["IngestionCost"],
-                "Storage": cost["StorageCost"],
-                "Total": cost["TotalCost"]
-            }
+            labels.append(f"{profile}:{cost['LogGroup']}")
+            ingestion.append(cost["IngestionCost"])
+            storage.append(cost["StorageCost"])
+            total.append(cost["TotalCost"])
 
-    if not all_costs:
+    if not labels:
         typer.echo("No costs found or access issues.")
         return
 
-    # Prepare data for graphs
-    labels = list(all_costs.keys())
-    ingestion = [all_costs[k]["Ingestion"] for k in labels]
-    storage = [all_costs[k]["Storage"] for k in labels]
-    total = [all_costs[k]["Total"] for k in labels]
+    # Sort by label so the x-axis doesn't depend on which profile finished first
+    order = np.argsort(labels, kind="stable")
+    labels = [labels[i] for i in order]
+    charts = [
+        ("Ingestion Costs by Log Group", "ingestion_costs.png", np.frombuffer(ingestion, dtype=np.float32)[order]),
+        ("Storage Costs by Log Group", "storage_costs.png", np.frombuffer(storage, dtype=np.float32)[order]),
+        ("Total Costs by Log Group", "total_costs.png", np.frombuffer(total, dtype=np.float32)[order]),
+    ]
 
-    # Helper function to create and save bar chart
-    def save_bar_chart(values, title, filename):
-        fig, ax = plt.subplots(figsize=(12, 8))
-        ax.bar(labels, values)
-        ax.set_title(title)
-        ax.set_xlabel("Log Group (Profile:Group)")
-        ax.set_ylabel("Cost ($)")
-        ax.tick_params(axis='x', rotation=45, ha='right')
-        plt.tight_layout()
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        plt.close(fig)
-
-    # Save graphs
-    save_bar_chart(ingestion, "Ingestion Costs by Log Group", "ingestion_costs.png")
-    save_bar_chart(storage, "Storage Costs by Log Group", "storage_costs.png")
-    save_bar_chart(total, "Total Costs by Log Group", "total_costs.png")
+    if renderer == "matplotlib":
+        render_charts_matplotlib(labels, charts)
+    else:
+        render_charts_pillow(labels, charts)
 
     typer.echo("Graphs saved as PNG files: ingestion_costs.png, storage_costs.png, total_costs.png")
     typer.echo("On macOS, you can open them with: open ingestion_costs.png (etc.)")